@@ -1,11 +1,27 @@
 #!/usr/bin/env python3
 """Minimalist Flask app for YB Airdrop Tracker"""
-from flask import Flask, request, render_template, send_file, session, redirect
+from flask import Flask, Response, request, render_template, stream_template, send_file, redirect
 from dotenv import load_dotenv
-import json
+import asyncio
+import atexit
+import contextvars
+import csv
+import hashlib
+import io
+import logging
 import os
+import orjson
+import re
 import tempfile
-from logic import fetch_airdrop_data, DEFAULT_TX_HASHES, DEFAULT_CONTRACTS_AND_FUNCTIONS
+import threading
+import time
+import uuid
+from collections import deque
+from pathlib import Path
+from itertools import islice
+from logic import fetch_airdrop_data_async, DEFAULT_TX_HASHES, DEFAULT_CONTRACTS_AND_FUNCTIONS
+
+log = logging.getLogger('airdrop')
 
 # Load environment variables from .env file
 load_dotenv()
@@ -15,88 +31,268 @@ if not os.environ.get('ETHERSCAN_API_KEY'):
     raise ValueError("ETHERSCAN_API_KEY not found in environment variables. Please set it in .env file.")
 
 app = Flask(__name__)
-app.config['TEMPLATES_AUTO_RELOAD'] = True
-app.secret_key = os.environ.get('SECRET_KEY', os.urandom(24).hex())
+
+# A freshly randomized key on every restart invalidates all in-flight
+# sessions, forcing clients to resubmit expensive fetches; require a
+# stable key in production and only fall back to a throwaway one in dev
+SECRET_KEY = os.environ.get('SECRET_KEY')
+if not SECRET_KEY:
+    if os.environ.get('FLASK_ENV') == 'production':
+        raise RuntimeError("SECRET_KEY must be set in production")
+    SECRET_KEY = os.urandom(24).hex()
+    logging.getLogger(__name__).warning("SECRET_KEY not set; using an ephemeral key (dev only)")
+app.secret_key = SECRET_KEY
+app.config['SESSION_COOKIE_HTTPONLY'] = True
+app.config['SESSION_COOKIE_SAMESITE'] = 'Lax'
+
+if os.environ.get('FLASK_ENV') == 'development':
+    app.config['TEMPLATES_AUTO_RELOAD'] = True
+else:
+    # Don't stat the template file on every render; keep every compiled
+    # template cached for the life of the process
+    app.config['TEMPLATES_AUTO_RELOAD'] = False
+    app.jinja_env.auto_reload = False
+    app.jinja_env.cache = {}
+
+# A tx hash is exactly 32 bytes of hex; scanning with one compiled regex
+# also silently drops malformed lines before they waste API calls
+TX_RE = re.compile(r'0x[0-9a-fA-F]{64}')
+
+# Form placeholders are constant — build them once instead of per GET
+EXAMPLE_TXS = '\n'.join(DEFAULT_TX_HASHES)
+EXAMPLE_CONTRACTS = orjson.dumps(DEFAULT_CONTRACTS_AND_FUNCTIONS, option=orjson.OPT_INDENT_2).decode()
+
+# ===================== IN-PROCESS JOB REGISTRY =====================
+# Jobs live entirely in memory: log lines go into a bounded deque instead of
+# a per-job file on disk, and poll() hands back only the lines the client
+# hasn't seen yet (no re-reading a growing log on every poll).
+JOB_TTL = 3600      # seconds before a finished job is swept
+JOB_MAX_LINES = 10000
+
+JOBS = {}
+JOBS_LOCK = threading.Lock()
+
+# All jobs run as coroutines on one persistent event loop, so the shared
+# aiohttp session (and its keep-alive connections) survives across jobs;
+# CPU-heavy aggregation hops to worker threads via asyncio.to_thread so
+# one job's number crunching doesn't stall another job's I/O
+JOB_LOOP = asyncio.new_event_loop()
+threading.Thread(target=JOB_LOOP.run_forever, daemon=True).start()
+
+# Identifies which job a log record belongs to; contextvars follow the
+# coroutine (and asyncio.to_thread workers), unlike thread ids
+CURRENT_JOB = contextvars.ContextVar('current_job', default=None)
+
+# All job CSVs are appended to one file and addressed by (offset, length):
+# one inode for the whole process instead of one file per job
+RESULTS_PATH = os.path.join(tempfile.gettempdir(), 'airdrop_results.bin')
+RESULTS_LOCK = threading.Lock()
+RESULTS_WR_FD = os.open(RESULTS_PATH, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | os.O_APPEND, 0o600)
+RESULTS_RD_FD = os.open(RESULTS_PATH, os.O_RDONLY)
+atexit.register(os.unlink, RESULTS_PATH)
+
+def _store_csv(data):
+    """Append CSV bytes to the shared results file, return (offset, length)."""
+    with RESULTS_LOCK:
+        offset = os.lseek(RESULTS_WR_FD, 0, os.SEEK_END)
+        os.write(RESULTS_WR_FD, data)
+    return offset, len(data)
+
+def _load_csv(job):
+    offset, length = job['csv']
+    return os.pread(RESULTS_RD_FD, length, offset)
+
+def _new_job():
+    return {
+        'lines': deque(maxlen=JOB_MAX_LINES),
+        'cursor': 0,          # total lines ever appended (monotonic)
+        # Sharing JOBS_LOCK keeps a single lock discipline for job state
+        'cond': threading.Condition(JOBS_LOCK),
+        'future': None,
+        'result': None,
+        'error': None,
+        'csv': None,          # (offset, length) into the shared results file
+        'etag': None,
+        'created': time.time(),
+    }
+
+class DequeHandler(logging.Handler):
+    """Logging handler that appends formatted records to a job's deque."""
+    def __init__(self, job):
+        super().__init__()
+        self.job = job
+
+    def emit(self, record):
+        lines = self.format(record).split('\n')
+        with JOBS_LOCK:
+            self.job['lines'].extend(lines)
+            self.job['cursor'] += len(lines)
+            self.job['cond'].notify_all()
+
+def _sweep_tmp_files(max_age=JOB_TTL):
+    """Remove stale temp CSVs (left behind by crashed or killed jobs)."""
+    cutoff = time.time() - max_age
+    for path in Path(tempfile.gettempdir()).glob('airdrop_*.csv'):
+        try:
+            if path.stat().st_mtime < cutoff:
+                path.unlink()
+        except OSError:
+            pass
+
+def _sweep_jobs():
+    while True:
+        time.sleep(300)
+        cutoff = time.time() - JOB_TTL
+        with JOBS_LOCK:
+            for jid, job in list(JOBS.items()):
+                if job['created'] < cutoff:
+                    del JOBS[jid]
+        _sweep_tmp_files()
+
+_sweep_tmp_files()  # clean up anything a previous process left behind
+atexit.register(_sweep_tmp_files, max_age=0)
+threading.Thread(target=_sweep_jobs, daemon=True).start()
+
+def _wake(job):
+    with JOBS_LOCK:
+        job['cond'].notify_all()
 
 @app.route('/')
 def index():
-    session.clear()
-    example_txs = '\n'.join(DEFAULT_TX_HASHES)
-    example_contracts = json.dumps(DEFAULT_CONTRACTS_AND_FUNCTIONS, indent=2)
-    return render_template('index.html', result=None, example_txs=example_txs, example_contracts=example_contracts)
+    return render_template('index.html', result=None, job_id=None, example_txs=EXAMPLE_TXS, example_contracts=EXAMPLE_CONTRACTS)
 
 @app.route('/run', methods=['POST'])
 def run():
     token = request.form['token'].strip()
     decimals = int(request.form['decimals'])
-    txhashes = [line.strip() for line in request.form['txhashes'].strip().split('\n') if line.strip()]
+    # Single regex pass; dict.fromkeys dedups while preserving order
+    txhashes = list(dict.fromkeys(TX_RE.findall(request.form['txhashes'])))
+    if not txhashes:
+        # Without this, logic.py would silently fall back to the example
+        # hashes and return results for transactions the user never sent
+        return "No valid transaction hashes found (expected 0x + 64 hex chars)", 400
     contracts_json = request.form.get('contracts', '').strip()
-    
-    # Parse contracts config
-    if contracts_json:
+
+    # Parse contracts config; most submissions send back the prefilled
+    # example verbatim, so short-circuit the parse for that exact string.
+    # Browsers submit textarea content with CRLF line endings, so
+    # normalize before comparing against the LF-only placeholder
+    if not contracts_json or contracts_json.replace('\r\n', '\n') == EXAMPLE_CONTRACTS:
+        contracts = DEFAULT_CONTRACTS_AND_FUNCTIONS
+    else:
         try:
-            contracts = json.loads(contracts_json)
-        except:
+            contracts = orjson.loads(contracts_json)
+        except orjson.JSONDecodeError:
             return "Invalid JSON for contracts", 400
-    else:
-        contracts = DEFAULT_CONTRACTS_AND_FUNCTIONS
-    
-    # Configure logic module
-    import logic
-    old_token = logic.TOKEN_CONTRACT
-    old_decimals = logic.DECIMALS
-    old_contracts = logic.DEFAULT_CONTRACTS_AND_FUNCTIONS
-    
-    logic.TOKEN_CONTRACT = token
-    logic.DECIMALS = decimals
-    logic.DEFAULT_CONTRACTS_AND_FUNCTIONS = contracts
-    
-    # Create temp CSV file
-    tmpfile = tempfile.NamedTemporaryFile(mode='w', delete=False, suffix='.csv', newline='')
-    tmpfile.close()
-    
-    try:
-        # Process synchronously (blocking) - suppress stdout
-        import sys
-        from io import StringIO
-        old_stdout = sys.stdout
-        sys.stdout = StringIO()  # Suppress all print statements
-        
-        rows, api_calls = fetch_airdrop_data(tx_hashes=txhashes, output_file=tmpfile.name, token_contract=token)
-        
-        sys.stdout = old_stdout  # Restore stdout
-    finally:
-        # Restore config
-        logic.TOKEN_CONTRACT = old_token
-        logic.DECIMALS = old_decimals
-        logic.DEFAULT_CONTRACTS_AND_FUNCTIONS = old_contracts
-    
-    # Store CSV file path in session
-    session['csv_file'] = tmpfile.name
-    
-    # Read CSV to get headers and preview
-    with open(tmpfile.name, 'r') as f:
-        import csv
-        reader = csv.reader(f)
-        headers = next(reader)
-        preview = [row for _, row in zip(range(100), reader)]
-    
-    result = {
-        'count': len(rows),
-        'api_calls': api_calls,
-        'headers': headers,
-        'preview': preview
-    }
-    
-    return render_template('index.html', result=result, example_txs='', example_contracts='')
 
-@app.route('/download', methods=['POST'])
-def download():
-    csv_file = session.get('csv_file')
-    if not csv_file or not os.path.exists(csv_file):
+    job_id = uuid.uuid4().hex
+    job = _new_job()
+
+    async def process():
+        # Route this job's log records into the in-memory job log; the
+        # contextvar filter keeps concurrent jobs out of each other's logs
+        CURRENT_JOB.set(job)
+        handler = DequeHandler(job)
+        handler.addFilter(lambda record: CURRENT_JOB.get() is job)
+        log.addHandler(handler)
+        try:
+            rows, api_calls, data = await fetch_airdrop_data_async(
+                tx_hashes=txhashes,
+                output_file=None,
+                token_contract=token,
+                decimals=decimals,
+                contracts=contracts,
+                use_cache=True
+            )
+
+            # Spill the CSV into the shared results file: downloads and
+            # the preview are served by range from there
+            job['csv'] = _store_csv(data)
+            job['etag'] = hashlib.sha256(data).hexdigest()[:16]
+            job['result'] = {
+                'count': len(rows),
+                'api_calls': api_calls,
+            }
+        except asyncio.CancelledError:
+            raise
+        except BaseException as e:
+            # BaseException on purpose: a stray SystemExit from library
+            # code must become a job error, not kill the shared loop
+            job['error'] = str(e)
+        finally:
+            log.removeHandler(handler)
+
+    job['future'] = asyncio.run_coroutine_threadsafe(process(), JOB_LOOP)
+    job['future'].add_done_callback(lambda _: _wake(job))
+    with JOBS_LOCK:
+        JOBS[job_id] = job
+
+    return render_template('index.html', result=None, job_id=job_id, example_txs='', example_contracts='')
+
+@app.route('/events/<job_id>')
+def events(job_id):
+    with JOBS_LOCK:
+        job = JOBS.get(job_id)
+    if job is None:
+        return "Unknown job", 404
+
+    def generate():
+        # One connection per job: each appended line is pushed as an SSE
+        # message instead of costing the client a full request round trip
+        cursor = 0
+        while True:
+            with JOBS_LOCK:
+                job['cond'].wait_for(lambda: job['cursor'] > cursor or job['future'].done(), timeout=30)
+                lines = list(job['lines'])
+                new_cursor = job['cursor']
+                done = job['future'].done()
+            # Clamp for lines that fell out of the bounded deque
+            start = max(0, len(lines) - (new_cursor - cursor)) if new_cursor > cursor else len(lines)
+            for line in lines[start:]:
+                yield f"data: {line}\n\n"
+            cursor = new_cursor
+            if done:
+                yield "event: done\ndata: finished\n\n"
+                return
+
+    return Response(generate(), mimetype='text/event-stream')
+
+@app.route('/result/<job_id>')
+def result(job_id):
+    with JOBS_LOCK:
+        job = JOBS.get(job_id)
+    if job is None or not job['future'].done():
+        return redirect('/')
+    if job['error']:
+        return f"Error: {job['error']}", 500
+    # Stream the preview straight off the CSV reader — Jinja pulls rows
+    # lazily, so the first 100 rows are never materialized into a list
+    reader = csv.reader(io.TextIOWrapper(io.BytesIO(_load_csv(job)), newline=''))
+    result_data = dict(job['result'], headers=next(reader), preview=islice(reader, 100))
+    resp = Response(stream_template('index.html', result=result_data, job_id=job_id, example_txs='', example_contracts=''))
+    # Result pages are sensitive and job-scoped; never cache them
+    resp.headers['Cache-Control'] = 'no-store'
+    return resp
+
+# GET, not POST: werkzeug only honors conditional requests (If-None-Match
+# -> 304) on GET/HEAD, and a plain link lets the browser cache the CSV
+@app.route('/download/<job_id>')
+def download(job_id):
+    with JOBS_LOCK:
+        job = JOBS.get(job_id)
+    if job is None or job['csv'] is None:
         return "No file to download", 404
-    return send_file(csv_file, as_attachment=True, download_name='airdrop_data.csv')
+    return send_file(
+        io.BytesIO(_load_csv(job)),
+        mimetype='text/csv',
+        as_attachment=True,
+        download_name='airdrop_data.csv',
+        etag=job['etag'],
+        conditional=True
+    )
 
 if __name__ == '__main__':
+    # Dev server only — in production run gunicorn against wsgi:app
+    # (see Procfile); the in-memory job registry requires workers=1
     port = int(os.environ.get('PORT', 5001))
     app.run(debug=False, port=port, host='0.0.0.0')
@@ -0,0 +1,5 @@
+"""WSGI entrypoint for production servers (gunicorn)"""
+from app import app
+
+if __name__ == "__main__":
+    app.run()